@@ -0,0 +1,158 @@
+"""
+Load harness mode sharding tanpa Telegram.
+
+Update sintetis -> ShardPool.route_update -> queue IPC -> _worker_main yang sama dengan mode
+produksi (Update.de_json, update_queue, concurrent_updates PTB, outbox). Yang diganti hanya
+handler (CPU + latensi create_temp_email tiruan) dan Bot API (request palsu dengan latensi).
+Mencetak throughput untuk 1..N worker.
+
+    python bench_sharding.py --updates 4000 --max-workers 4
+"""
+import argparse
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import time
+
+from telegram import Update
+from telegram.ext import CommandHandler
+from telegram.request import BaseRequest
+
+import mailv2
+from mailv2 import SendBudget, ShardPool, shard_for
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeBotAPI(BaseRequest):
+    """Bot API palsu: semua endpoint sukses setelah latency_ms."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        await asyncio.sleep(self.latency_ms / 1000)
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint == "sendMessage":
+            result = {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": params["chat_id"], "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class BenchHandlers:
+    """Pengganti register_handlers: /buatemail dengan biaya CPU dan latensi jaringan tiruan."""
+
+    def __init__(self, done, cpu_ms: float, latency_ms: float):
+        self.done = done
+        self.cpu_ms = cpu_ms
+        self.latency_ms = latency_ms
+
+    def __call__(self, application):
+        application.add_handler(CommandHandler("buatemail", self.handle))
+
+    async def handle(self, update, context):
+        # bagian CPU (render teks, parsing JSON) menahan event loop; bagian jaringan tidak
+        deadline = time.perf_counter() + self.cpu_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+        await asyncio.sleep(self.latency_ms / 1000)
+        await mailv2.outbox.send(update.message.chat_id, text="selesai")
+        self.done.put(1)
+
+
+def fake_update(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": "/buatemail",
+            "entities": [{"type": "bot_command", "offset": 0, "length": len("/buatemail")}],
+        },
+    }
+
+def _wait_done(done, count: int):
+    for _ in range(count):
+        done.get()
+
+async def _route_all(pool: ShardPool, updates):
+    for update in updates:
+        await pool.route_update(update, None)
+
+def run_once(num_workers: int, updates: int, cpu_ms: float, latency_ms: float, api_ms: float) -> float:
+    ctx = multiprocessing.get_context("spawn")
+    done = ctx.Queue()
+    # batas Telegram tidak ikut diukur di sini; tiap update memakai chat sendiri
+    budget = SendBudget(1_000_000, ctx)
+    pool = ShardPool(
+        num_workers, mailv2._worker_main, ("123456:BENCH", budget),
+        kwargs={
+            "setup": BenchHandlers(done, cpu_ms, latency_ms),
+            "request_factory": functools.partial(FakeBotAPI, api_ms),
+        },
+        ctx=ctx,
+    )
+    pool.start()
+    try:
+        # pemanasan: satu update per shard agar waktu start proses tidak ikut terukur
+        warmup = {}
+        chat_id = 10_000_000
+        while len(warmup) < num_workers:
+            warmup.setdefault(shard_for(chat_id, num_workers), chat_id)
+            chat_id += 1
+        asyncio.run(_route_all(pool, [Update.de_json(fake_update(0, c), None) for c in warmup.values()]))
+        _wait_done(done, num_workers)
+
+        batch = [Update.de_json(fake_update(i + 1, 1000 + i), None) for i in range(updates)]
+        started = time.perf_counter()
+        asyncio.run(_route_all(pool, batch))
+        _wait_done(done, updates)
+        return time.perf_counter() - started
+    finally:
+        pool.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load harness mode sharding")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--cpu-ms", type=float, default=2.0)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--api-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    # speedup hanya bisa mendekati linear sampai jumlah core
+    print(f"CPU: {os.cpu_count()}, cpu_ms={args.cpu_ms}, latency_ms={args.latency_ms}, api_ms={args.api_ms}")
+    print(f"{'worker':>6} {'detik':>8} {'update/s':>10} {'speedup':>8}")
+    base = None
+    for n in range(1, args.max_workers + 1):
+        elapsed = run_once(n, args.updates, args.cpu_ms, args.latency_ms, args.api_ms)
+        rate = args.updates / elapsed
+        base = base or rate
+        print(f"{n:>6} {elapsed:>8.2f} {rate:>10.1f} {rate / base:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
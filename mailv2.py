@@ -1,11 +1,17 @@
+import asyncio
+import collections
 import logging
+import multiprocessing
+import zlib
 import httpx
 import random
+import signal
 import string
+import time
 from faker import Faker
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler
-from telegram.error import BadRequest
+from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler, TypeHandler
+from telegram.error import BadRequest, RetryAfter
 
 # Konfigurasi logging
 logging.basicConfig(
@@ -26,6 +32,8 @@ fake = Faker('id_ID')
 #       'messages': [...]
 #     }
 #   }
+# Pada mode sharding, tiap proses worker memegang partisi sendiri:
+# front receiver selalu meneruskan update chat_id yang sama ke worker yang sama.
 user_sessions = {}
 
 # ============================================================
@@ -264,6 +272,371 @@ async def fetch_message_content(token_like, provider: str, message_id, base_url_
         return await read_mailtm(token_like, message_id)
 
 
+# ============================================================
+# ANTRIAN KIRIM TELEGRAM (rate limit, coalescing edit, RetryAfter)
+# ============================================================
+GLOBAL_SEND_RATE = 25       # request/detik untuk seluruh bot (batas Telegram ~30)
+PER_CHAT_INTERVAL = 1.0     # jeda minimal (detik) antar kirim/edit ke chat yang sama
+PROCESSING_DELAY = 1.5      # pesan "sedang diproses" hanya dikirim jika jawaban belum siap
+METRICS_INTERVAL = 60       # interval log metrik antrian (detik)
+_NO_CHAT_INTERVAL = ("delete", "answer")
+
+def _retry_seconds(retry_after) -> float:
+    # PTB lama memberi int, PTB baru memberi timedelta
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+def _log_failure(future: asyncio.Future):
+    # kebanyakan job tidak di-await handler; error dicatat di sini
+    # (sekaligus mencegah "Future exception was never retrieved")
+    if future.cancelled() or future.exception() is None:
+        return
+    e = future.exception()
+    if isinstance(e, BadRequest):
+        if "Message is not modified" not in str(e):
+            logger.error(f"Error BadRequest saat mengirim ke Telegram: {e}")
+    else:
+        logger.error(f"Error tak terduga saat mengirim ke Telegram: {e}")
+
+def _copy_result(src: asyncio.Future, dst: asyncio.Future):
+    if dst.done():
+        return
+    if src.cancelled():
+        dst.cancel()
+    elif src.exception() is not None:
+        dst.set_exception(src.exception())
+    else:
+        dst.set_result(src.result())
+
+class SendBudget:
+    """
+    Token bucket global + jeda RetryAfter. Flood limit Telegram berlaku per token bot,
+    jadi pada mode sharding satu SendBudget dibuat di front dan dibagi ke semua worker
+    (nilai di shared memory; waktu pakai time.monotonic yang sama antar proses di Linux).
+    """
+
+    def __init__(self, rate: float = GLOBAL_SEND_RATE, ctx=None):
+        ctx = ctx or multiprocessing.get_context()
+        self.rate = rate
+        self._lock = ctx.Lock()
+        self._tokens = ctx.Value("d", rate, lock=False)
+        self._stamp = ctx.Value("d", time.monotonic(), lock=False)
+        self._paused_until = ctx.Value("d", 0.0, lock=False)
+
+    def acquire(self, now: float) -> float:
+        """Ambil satu slot kirim. 0.0 jika berhasil, selain itu lama tunggu (detik)."""
+        with self._lock:
+            if now < self._paused_until.value:
+                return self._paused_until.value - now
+            tokens = min(self.rate, self._tokens.value + (now - self._stamp.value) * self.rate)
+            self._stamp.value = now
+            if tokens >= 1:
+                self._tokens.value = tokens - 1
+                return 0.0
+            self._tokens.value = tokens
+            return (1 - tokens) / self.rate
+
+    def pause(self, until: float):
+        with self._lock:
+            self._paused_until.value = max(self._paused_until.value, until)
+
+    def paused_for(self, now: float) -> float:
+        with self._lock:
+            return max(0.0, self._paused_until.value - now)
+
+class _OutboundJob:
+    def __init__(self, kind: str, chat_id: int | None, kwargs: dict, not_before: float = 0.0):
+        self.kind = kind            # 'send' | 'edit' | 'delete' | 'answer'
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.not_before = not_before
+        self.enqueued_at = time.monotonic()
+        self.dispatched = False
+        self.future = asyncio.get_running_loop().create_future()
+        self.future.add_done_callback(_log_failure)
+
+    def __await__(self):
+        return self.future.__await__()
+
+class OutboundQueue:
+    """
+    Antrian keluar ke Telegram:
+      - batas global (SendBudget, default GLOBAL_SEND_RATE/detik) dan per chat (PER_CHAT_INTERVAL);
+        delete tidak terkena jeda per chat; answer callback di luar antrian chat (hanya butuh budget global)
+      - edit ke pesan yang sama yang belum terkirim digabung, hanya isi terakhir yang dikirim
+      - RetryAfter (429) => semua kiriman dijeda, job dicoba ulang
+    Job bisa di-await untuk mendapat hasil (Message/bool) atau dibiarkan jalan sendiri.
+    """
+
+    def __init__(self, bot, global_rate: float = GLOBAL_SEND_RATE, per_chat_interval: float = PER_CHAT_INTERVAL,
+                 budget: SendBudget | None = None):
+        self.bot = bot
+        self.budget = budget or SendBudget(global_rate)
+        self.per_chat_interval = per_chat_interval
+        self._chats = {}        # chat_id -> deque[_OutboundJob] (urutan per chat dijaga)
+        self._edits = {}        # (chat_id, message_id) -> edit yang belum terkirim
+        self._ready_at = {}     # chat_id -> monotonic kapan boleh kirim lagi
+        self._answers = collections.deque()  # answer callback, tidak ikut FIFO chat
+        self._busy = set()      # chat_id dengan request yang sedang berjalan
+        self._wakeup = asyncio.Event()
+        self._inflight = set()
+        self._tasks = []
+        # metrik
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.retry_after_hits = 0
+        self._lat_count = 0
+        self._lat_total = 0.0
+        self._lat_max = 0.0
+        # jendela latensi untuk log periodik (_report), terpisah dari angka kumulatif metrics()
+        self._win_count = 0
+        self._win_total = 0.0
+        self._win_max = 0.0
+
+    # --- API ---
+    def send(self, chat_id: int, delay: float = 0.0, **kwargs) -> _OutboundJob:
+        job = _OutboundJob("send", chat_id, dict(kwargs, chat_id=chat_id), time.monotonic() + delay)
+        return self._push(job)
+
+    def edit(self, chat_id: int, message_id: int, **kwargs) -> _OutboundJob:
+        key = (chat_id, message_id)
+        pending = self._edits.get(key)
+        if pending:
+            pending.kwargs = dict(kwargs, chat_id=chat_id, message_id=message_id)
+            self.coalesced += 1
+            return pending
+        job = _OutboundJob("edit", chat_id, dict(kwargs, chat_id=chat_id, message_id=message_id))
+        self._edits[key] = job
+        return self._push(job)
+
+    def delete(self, chat_id: int, message_id: int) -> _OutboundJob:
+        # edit yang belum terkirim ke pesan yang akan dihapus tidak ada gunanya
+        pending = self._edits.pop((chat_id, message_id), None)
+        if pending:
+            self._discard(pending)
+        job = _OutboundJob("delete", chat_id, {"chat_id": chat_id, "message_id": message_id})
+        return self._push(job)
+
+    def answer(self, callback_query_id: str, **kwargs) -> _OutboundJob:
+        job = _OutboundJob("answer", None, dict(kwargs, callback_query_id=callback_query_id))
+        return self._push(job)
+
+    async def retract(self, job: _OutboundJob):
+        """
+        Tarik kembali pesan 'send': dibuang jika belum terkirim, dihapus jika sudah.
+        Selesai setelah pesan benar-benar hilang, jadi kiriman berikutnya ke chat itu muncul sesudahnya.
+        """
+        if not job.dispatched and not job.future.done():
+            self._discard(job)
+            return
+        # error kirim/hapus sudah dicatat _log_failure
+        try:
+            message = await job
+            if message:
+                await self.delete(job.chat_id, message.message_id)
+        except Exception:
+            pass
+
+    def depth(self) -> int:
+        return len(self._answers) + sum(len(jobs) for jobs in self._chats.values())
+
+    def metrics(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "in_flight": len(self._inflight),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "retry_after": self.retry_after_hits,
+            "latency_avg": (self._lat_total / self._lat_count) if self._lat_count else 0.0,
+            "latency_max": self._lat_max,
+        }
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._report())]
+
+    async def stop(self, timeout: float = 5.0):
+        # beri kesempatan sisa antrian terkirim sebelum berhenti
+        deadline = time.monotonic() + timeout
+        while (self.depth() or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._inflight, return_exceptions=True)
+
+    # --- internal ---
+    def _push(self, job: _OutboundJob) -> _OutboundJob:
+        if job.kind == "answer":
+            self._answers.append(job)
+        else:
+            self._chats.setdefault(job.chat_id, collections.deque()).append(job)
+        self._wakeup.set()
+        return job
+
+    def _discard(self, job: _OutboundJob):
+        jobs = self._chats.get(job.chat_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+        if not job.future.done():
+            job.future.set_result(None)
+        self.dropped += 1
+
+    def _record_latency(self, job: _OutboundJob):
+        # jeda yang disengaja (delay) tidak dihitung sebagai latensi antrian
+        latency = time.monotonic() - max(job.enqueued_at, job.not_before)
+        self._lat_count += 1
+        self._lat_total += latency
+        self._lat_max = max(self._lat_max, latency)
+        self._win_count += 1
+        self._win_total += latency
+        self._win_max = max(self._win_max, latency)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            wait = self._dispatch_ready(time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch_ready(self, now: float) -> float | None:
+        """Jalankan semua job yang boleh dikirim; kembalikan waktu tunggu sampai job berikutnya siap."""
+        paused = self.budget.paused_for(now)
+        if paused:
+            return paused
+
+        while self._answers:
+            global_wait = self.budget.acquire(now)
+            if global_wait:
+                return global_wait
+            self._dispatch(self._answers.popleft())
+
+        wait = None
+        for chat_id, jobs in list(self._chats.items()):
+            if not jobs:
+                # chat kosong dibuang setelah jedanya lewat, sekalian entri _ready_at-nya
+                ready = self._ready_at.get(chat_id, 0.0)
+                if ready > now:
+                    wait = ready - now if wait is None else min(wait, ready - now)
+                elif chat_id not in self._busy:
+                    del self._chats[chat_id]
+                    self._ready_at.pop(chat_id, None)
+                continue
+            if chat_id in self._busy:
+                continue
+            head = jobs[0]
+            ready = head.not_before
+            if head.kind not in _NO_CHAT_INTERVAL:
+                ready = max(ready, self._ready_at.get(chat_id, 0.0))
+            if ready > now:
+                wait = ready - now if wait is None else min(wait, ready - now)
+                continue
+            global_wait = self.budget.acquire(now)
+            if global_wait:
+                return global_wait if wait is None else min(wait, global_wait)
+            jobs.popleft()
+            # pindahkan chat ke belakang supaya chat lain kebagian giliran
+            self._chats[chat_id] = self._chats.pop(chat_id)
+            self._dispatch(head)
+        return wait
+
+    def _dispatch(self, job: _OutboundJob):
+        job.dispatched = True
+        if job.kind == "edit" and self._edits.get((job.chat_id, job.kwargs["message_id"])) is job:
+            del self._edits[(job.chat_id, job.kwargs["message_id"])]
+        if job.kind != "answer":
+            self._busy.add(job.chat_id)
+        task = asyncio.create_task(self._perform(job))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _call(self, job: _OutboundJob):
+        if job.kind == "send":
+            return await self.bot.send_message(**job.kwargs)
+        if job.kind == "edit":
+            return await self.bot.edit_message_text(**job.kwargs)
+        if job.kind == "answer":
+            return await self.bot.answer_callback_query(**job.kwargs)
+        return await self.bot.delete_message(**job.kwargs)
+
+    async def _perform(self, job: _OutboundJob):
+        try:
+            result = await self._call(job)
+        except RetryAfter as e:
+            self.retry_after_hits += 1
+            pause = _retry_seconds(e.retry_after)
+            self.budget.pause(time.monotonic() + pause)
+            logger.warning(f"Telegram RetryAfter {pause:g}s, antrian kirim dijeda.")
+            self._requeue(job)
+        except Exception as e:
+            self._record_latency(job)
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            self._record_latency(job)
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            if job.kind != "answer":
+                self._busy.discard(job.chat_id)
+            if job.kind not in _NO_CHAT_INTERVAL:
+                self._ready_at[job.chat_id] = time.monotonic() + self.per_chat_interval
+            self._wakeup.set()
+
+    def _requeue(self, job: _OutboundJob):
+        job.dispatched = False
+        if job.kind == "edit":
+            key = (job.chat_id, job.kwargs["message_id"])
+            newer = self._edits.get(key)
+            if newer:
+                # sudah ada edit lebih baru ke pesan ini; ikut hasil edit itu
+                newer.future.add_done_callback(lambda f: _copy_result(f, job.future))
+                return
+            self._edits[key] = job
+        if job.kind == "answer":
+            self._answers.appendleft(job)
+        else:
+            self._chats.setdefault(job.chat_id, collections.deque()).appendleft(job)
+
+    async def _report(self):
+        last_sent = self.sent
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL)
+            if self.sent == last_sent and not self.depth():
+                continue
+            last_sent = self.sent
+            m = self.metrics()
+            win_avg = (self._win_total / self._win_count) if self._win_count else 0.0
+            logger.info(
+                f"Antrian kirim: depth={m['depth']} in_flight={m['in_flight']} sent={m['sent']} "
+                f"coalesced={m['coalesced']} dropped={m['dropped']} retry_after={m['retry_after']} "
+                f"latency_avg={win_avg:.3f}s latency_max={self._win_max:.3f}s (interval terakhir)"
+            )
+            self._win_count, self._win_total, self._win_max = 0, 0.0, 0.0
+
+# diisi saat aplikasi start (per proses; pada mode sharding tiap worker punya antrian sendiri)
+outbox: OutboundQueue | None = None
+
+async def start_outbox(application: Application, budget: SendBudget | None = None):
+    global outbox
+    outbox = OutboundQueue(application.bot, budget=budget)
+    outbox.start()
+
+async def stop_outbox(application: Application):
+    if outbox:
+        await outbox.stop()
+
+def _thread_of(message) -> dict:
+    # sama seperti reply_text: balas di topik forum yang sama
+    if message.is_topic_message and message.message_thread_id:
+        return {"message_thread_id": message.message_thread_id}
+    return {}
+
+
 # ============================================================
 # UI TELEGRAM (TIDAK DIUBAH TAMPILAN)
 # ============================================================
@@ -283,15 +656,19 @@ def get_base_info_text(email, password, footer_text):
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = update.message.from_user.first_name
-    await update.message.reply_text(
-        f"👋 Halo, *{user_name}*!\n\nKirim /buatemail untuk membuat email baru.", parse_mode='Markdown'
+    outbox.send(
+        update.message.chat_id, **_thread_of(update.message),
+        text=f"👋 Halo, *{user_name}*!\n\nKirim /buatemail untuk membuat email baru.", parse_mode='Markdown'
     )
 
 async def buat_email_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.message.chat_id
-    processing_message = await update.message.reply_text("⏳ Sedang membuat akun email Anda...")
+    thread = _thread_of(update.message)
+    # pesan proses hanya benar-benar terkirim jika pembuatan email lebih lama dari PROCESSING_DELAY
+    processing_message = outbox.send(chat_id, delay=PROCESSING_DELAY, **thread, text="⏳ Sedang membuat akun email Anda...")
     result, error = await create_temp_email()
-    await context.bot.delete_message(chat_id=chat_id, message_id=processing_message.message_id)
+    # tunggu pesan proses benar-benar hilang agar tidak muncul di bawah jawaban
+    await outbox.retract(processing_message)
     if result:
         user_sessions[chat_id] = {
             'provider': result['provider'],
@@ -301,18 +678,19 @@ async def buat_email_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         }
         keyboard = [[InlineKeyboardButton("📬 Cek Inbox", callback_data="check_inbox_0")]]
         response_text = get_base_info_text(result['email'], result['password'], "Gunakan tombol di bawah untuk memeriksa inbox.")
-        await update.message.reply_text(response_text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+        outbox.send(chat_id, **thread, text=response_text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
     else:
-        await update.message.reply_text(f"❌ *Gagal Membuat Email*\n\n*Alasan:* {error}", parse_mode='Markdown')
+        outbox.send(chat_id, **thread, text=f"❌ *Gagal Membuat Email*\n\n*Alasan:* {error}", parse_mode='Markdown')
 
 async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
+    outbox.answer(query.id)
 
     chat_id = query.message.chat_id
+    message_id = query.message.message_id
     session = user_sessions.get(chat_id)
     if not session:
-        await query.edit_message_text("Sesi tidak ditemukan. Buat email baru dengan /buatemail.")
+        outbox.edit(chat_id, message_id, text="Sesi tidak ditemukan. Buat email baru dengan /buatemail.")
         return
 
     action_parts = query.data.split('_')
@@ -325,7 +703,7 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
     if action == "check" and "inbox" in action_parts:
         token, error = await get_auth_token(email, password, provider)
         if error:
-            await query.edit_message_text(f"Error: {error}")
+            outbox.edit(chat_id, message_id, text=f"Error: {error}")
             return
 
         messages_pack, error = await fetch_messages(token, provider, base_url_hint=session.get('base'))
@@ -345,10 +723,10 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
                     base_text = get_base_info_text(fallback_result['email'], fallback_result['password'],
                                                    "Provider utama sedang diblokir, akun baru dibuat otomatis.")
                     keyboard_list = [[InlineKeyboardButton("📬 Cek Inbox", callback_data="check_inbox_0")]]
-                    await query.edit_message_text(text=base_text, parse_mode='Markdown',
-                                                  reply_markup=InlineKeyboardMarkup(keyboard_list))
+                    outbox.edit(chat_id, message_id, text=base_text, parse_mode='Markdown',
+                                reply_markup=InlineKeyboardMarkup(keyboard_list))
                     return
-            await query.edit_message_text(f"Error: {error}")
+            outbox.edit(chat_id, message_id, text=f"Error: {error}")
             return
 
         messages = messages_pack["items"]
@@ -380,19 +758,19 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
             msg_index = int(action_parts[2])
             message_to_open = user_sessions[chat_id]['messages'][msg_index]
         except (ValueError, IndexError):
-            await query.edit_message_text("Pesan tidak valid.")
+            outbox.edit(chat_id, message_id, text="Pesan tidak valid.")
             return
 
         token, error = await get_auth_token(email, password, provider)
         if error:
-            await query.edit_message_text(f"Error: {error}")
+            outbox.edit(chat_id, message_id, text=f"Error: {error}")
             return
 
         content_pack, error = await fetch_message_content(
             token, provider, message_to_open['id'], base_url_hint=user_sessions[chat_id].get('base')
         )
         if error:
-            await query.edit_message_text(f"Error: {error}")
+            outbox.edit(chat_id, message_id, text=f"Error: {error}")
             return
 
         if provider == "1secmail" and content_pack.get("base"):
@@ -414,16 +792,130 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
         reply_markup = InlineKeyboardMarkup(keyboard_list)
 
     # --- Edit pesan aman ---
+    # tidak di-await: klik beruntun ke pesan yang sama digabung di antrian, hanya isi terakhir yang dikirim
     if response_text and reply_markup:
+        outbox.edit(chat_id, message_id, text=response_text, parse_mode='Markdown', reply_markup=reply_markup)
+
+# ============================================================
+# MODE SHARDING (multi-proses, routing berdasarkan chat_id)
+# ============================================================
+
+def shard_for(chat_id: int | None, num_workers: int) -> int:
+    """Worker pemilik sesi chat_id. Stabil antar proses (tidak pakai hash() bawaan)."""
+    if chat_id is None or num_workers <= 1:
+        return 0
+    return zlib.crc32(str(chat_id).encode()) % num_workers
+
+def register_handlers(application: Application):
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("buatemail", buat_email_command))
+    application.add_handler(CallbackQueryHandler(button_callback_handler))
+
+async def _worker_loop(token: str, budget: SendBudget, shard: int, num_workers: int, inbox,
+                       setup=register_handlers, request_factory=None):
+    # worker tidak polling; update datang dari front receiver lewat queue IPC.
+    # concurrent_updates: handler kebanyakan menunggu jaringan (create_temp_email bisa puluhan detik),
+    # satu chat yang lambat tidak boleh menahan chat lain di shard yang sama
+    builder = Application.builder().token(token).updater(None).concurrent_updates(True)
+    if request_factory:
+        # setup/request_factory bisa diganti (load harness: handler & Bot API palsu)
+        builder = builder.request(request_factory())
+    application = builder.build()
+    setup(application)
+    loop = asyncio.get_running_loop()
+    async with application:
+        await application.start()
         try:
-            await query.edit_message_text(text=response_text, parse_mode='Markdown', reply_markup=reply_markup)
-        except BadRequest as e:
-            if "Message is not modified" in str(e):
-                pass
-            else:
-                logger.error(f"Error BadRequest saat mengedit pesan: {e}")
-        except Exception as e:
-            logger.error(f"Error tak terduga saat mengedit pesan: {e}")
+            # budget global & jeda RetryAfter dibagi semua worker; batas per chat tetap tepat
+            # karena chat selalu di worker yang sama
+            await start_outbox(application, budget=budget)
+            logger.info(f"Worker shard-{shard} siap.")
+            while True:
+                data = await loop.run_in_executor(None, inbox.get)
+                if data is None:
+                    break
+                try:
+                    await application.update_queue.put(Update.de_json(data, application.bot))
+                except Exception as e:
+                    logger.error(f"Worker shard-{shard} gagal memproses update: {e}")
+        finally:
+            await application.stop()
+            await stop_outbox(application)
+
+def _worker_main(token: str, budget: SendBudget, shard: int, num_workers: int, inbox,
+                 setup=register_handlers, request_factory=None):
+    # Ctrl+C juga sampai ke worker (satu process group); shutdown dikendalikan front lewat sentinel None
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_loop(token, budget, shard, num_workers, inbox, setup, request_factory))
+
+class ShardPool:
+    """
+    Proses worker + queue IPC per shard.
+    target dipanggil sebagai target(*args, shard, num_workers, inbox, **kwargs); worker yang mati
+    dijalankan ulang saat update berikutnya untuk shard itu datang.
+    """
+
+    def __init__(self, num_workers: int, target, args: tuple = (), kwargs: dict | None = None, ctx=None):
+        self.ctx = ctx or multiprocessing.get_context("spawn")
+        self.num_workers = num_workers
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.inboxes = [self.ctx.Queue() for _ in range(num_workers)]
+        self.workers = [None] * num_workers
+
+    def _spawn(self, shard: int):
+        worker = self.ctx.Process(
+            target=self.target,
+            args=(*self.args, shard, self.num_workers, self.inboxes[shard]),
+            kwargs=self.kwargs,
+            name=f"shard-{shard}",
+            daemon=True,
+        )
+        worker.start()
+        self.workers[shard] = worker
+
+    def start(self):
+        for shard in range(self.num_workers):
+            self._spawn(shard)
+
+    def dispatch(self, chat_id: int | None, data: dict):
+        shard = shard_for(chat_id, self.num_workers)
+        worker = self.workers[shard]
+        if not worker.is_alive():
+            logger.error(
+                f"Worker shard-{shard} mati (exitcode={worker.exitcode}), dijalankan ulang; "
+                f"sesi di shard ini hilang."
+            )
+            self._spawn(shard)
+        self.inboxes[shard].put(data)
+
+    async def route_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        chat = update.effective_chat
+        self.dispatch(chat.id if chat else None, update.to_dict())
+
+    def stop(self, timeout: float = 10):
+        for q in self.inboxes:
+            q.put(None)
+        for worker in self.workers:
+            if worker is None:
+                continue
+            worker.join(timeout=timeout)
+            if worker.is_alive():
+                worker.terminate()
+
+def run_sharded(token: str, num_workers: int):
+    ctx = multiprocessing.get_context("spawn")
+    budget = SendBudget(GLOBAL_SEND_RATE, ctx)
+    pool = ShardPool(num_workers, _worker_main, (token, budget), ctx=ctx)
+    pool.start()
+
+    application = Application.builder().token(token).build()
+    application.add_handler(TypeHandler(Update, pool.route_update))
+    try:
+        application.run_polling()
+    finally:
+        pool.stop()
 
 # --- MAIN ---
 def main():
@@ -432,12 +924,25 @@ def main():
     if not token:
         print("\n[!] KESALAHAN: Token tidak boleh kosong. Skrip berhenti.")
         return
+    workers_raw = input("Jumlah proses worker (Enter = 1): ").strip()
+    try:
+        num_workers = max(1, int(workers_raw)) if workers_raw else 1
+    except ValueError:
+        print("\n[!] Jumlah worker tidak valid, memakai 1 proses.")
+        num_workers = 1
     print("\n[✓] Token diterima. Menjalankan bot...\n" + "="*50)
 
-    application = Application.builder().token(token).build()
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("buatemail", buat_email_command))
-    application.add_handler(CallbackQueryHandler(button_callback_handler))
+    if num_workers > 1:
+        print(f"\nBot sekarang online dengan {num_workers} worker! Tekan CTRL+C untuk berhenti.")
+        run_sharded(token, num_workers)
+        return
+
+    # concurrent_updates: handler menunggu jaringan dan antrian kirim, chat lain tidak boleh ikut tertahan
+    application = (
+        Application.builder().token(token).concurrent_updates(True)
+        .post_init(start_outbox).post_stop(stop_outbox).build()
+    )
+    register_handlers(application)
 
     print("\nBot sekarang online! Tekan CTRL+C untuk berhenti.")
     application.run_polling()
@@ -0,0 +1,187 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from mailv2 import OutboundQueue
+
+
+class FakeMessage:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+
+class FakeBot:
+    def __init__(self, retry_after_edits=0):
+        self.calls = []
+        self.retry_after_edits = retry_after_edits
+        self.next_id = 100
+
+    async def send_message(self, **kwargs):
+        self.calls.append(("send", time.monotonic(), kwargs))
+        self.next_id += 1
+        return FakeMessage(self.next_id)
+
+    async def edit_message_text(self, **kwargs):
+        if self.retry_after_edits:
+            self.retry_after_edits -= 1
+            await asyncio.sleep(0.05)
+            raise RetryAfter(1)
+        self.calls.append(("edit", time.monotonic(), kwargs))
+        return True
+
+    async def delete_message(self, **kwargs):
+        self.calls.append(("delete", time.monotonic(), kwargs))
+        return True
+
+    async def answer_callback_query(self, **kwargs):
+        self.calls.append(("answer", time.monotonic(), kwargs))
+        return True
+
+
+def run(coro_fn, bot, **kwargs):
+    async def runner():
+        queue = OutboundQueue(bot, **kwargs)
+        queue.start()
+        try:
+            return await coro_fn(queue)
+        finally:
+            await queue.stop()
+    return asyncio.run(runner())
+
+
+def test_pending_edits_are_coalesced():
+    bot = FakeBot()
+
+    async def scenario(queue):
+        jobs = [queue.edit(1, 7, text=f"v{i}") for i in range(5)]
+        return await asyncio.gather(*jobs), queue.metrics()
+
+    results, metrics = run(scenario, bot)
+    assert results == [True] * 5
+    assert [c[2]["text"] for c in bot.calls if c[0] == "edit"] == ["v4"]
+    assert metrics["coalesced"] == 4
+
+
+def test_retract_before_dispatch_drops_message():
+    bot = FakeBot()
+
+    async def scenario(queue):
+        job = queue.send(1, delay=0.5, text="proses")
+        await queue.retract(job)
+        result = await job
+        await queue.send(1, text="jawaban")
+        return result, queue.metrics()
+
+    result, metrics = run(scenario, bot)
+    assert result is None
+    assert [c[2]["text"] for c in bot.calls] == ["jawaban"]
+    assert metrics["dropped"] == 1
+
+
+def test_retract_after_dispatch_deletes_message():
+    bot = FakeBot()
+
+    async def scenario(queue):
+        job = queue.send(1, text="proses")
+        while not job.dispatched:
+            await asyncio.sleep(0.005)
+        await queue.retract(job)
+        await queue.send(1, text="jawaban")
+        return await job
+
+    message = run(scenario, bot, per_chat_interval=0.05)
+    # pesan proses sudah hilang sebelum jawaban dikirim
+    assert [c[0] for c in bot.calls] == ["send", "delete", "send"]
+    assert bot.calls[1][2] == {"chat_id": 1, "message_id": message.message_id}
+    assert bot.calls[2][2]["text"] == "jawaban"
+
+
+def test_retry_after_requeues_edit():
+    bot = FakeBot(retry_after_edits=1)
+
+    async def scenario(queue):
+        started = time.monotonic()
+        result = await queue.edit(1, 7, text="v1")
+        return result, time.monotonic() - started, queue.metrics()
+
+    result, elapsed, metrics = run(scenario, bot)
+    assert result is True
+    assert elapsed >= 1.0
+    assert [c[2]["text"] for c in bot.calls] == ["v1"]
+    assert metrics["retry_after"] == 1
+
+
+def test_retry_after_with_newer_edit_sends_only_latest():
+    bot = FakeBot(retry_after_edits=1)
+
+    async def scenario(queue):
+        first = queue.edit(1, 7, text="v1")
+        # edit baru datang saat edit pertama sedang in-flight (lalu kena RetryAfter)
+        while not first.dispatched:
+            await asyncio.sleep(0.005)
+        second = queue.edit(1, 7, text="v2")
+        assert second is not first
+        return await asyncio.gather(first, second)
+
+    results = run(scenario, bot)
+    assert results == [True, True]
+    assert [c[2]["text"] for c in bot.calls] == ["v2"]
+
+
+def test_per_chat_interval():
+    bot = FakeBot()
+
+    async def scenario(queue):
+        await asyncio.gather(*(queue.send(1, text=str(i)) for i in range(3)), queue.send(2, text="lain"))
+
+    run(scenario, bot, per_chat_interval=0.2)
+    chat1 = [c[1] for c in bot.calls if c[2]["chat_id"] == 1]
+    assert [c[2]["text"] for c in bot.calls if c[2]["chat_id"] == 1] == ["0", "1", "2"]
+    assert all(b - a >= 0.19 for a, b in zip(chat1, chat1[1:]))
+    # chat lain tidak ikut menunggu jeda chat 1
+    assert [c[1] for c in bot.calls if c[2]["chat_id"] == 2][0] - chat1[0] < 0.1
+
+
+def test_answer_skips_chat_queue_and_keeps_coalescing():
+    bot = FakeBot()
+
+    async def scenario(queue):
+        first = queue.edit(1, 7, text="v1")
+        while not first.dispatched:
+            await asyncio.sleep(0.005)
+        # klik berikutnya: edit baru menunggu jeda chat, answer tidak
+        second = queue.edit(1, 7, text="v2")
+        started = time.monotonic()
+        await queue.answer("cb1")
+        answered = time.monotonic() - started
+        third = queue.edit(1, 7, text="v3")
+        await asyncio.gather(first, second, third)
+        return answered, queue.metrics()
+
+    answered, metrics = run(scenario, bot, per_chat_interval=0.5)
+    assert answered < 0.1
+    assert [c[2]["text"] for c in bot.calls if c[0] == "edit"] == ["v1", "v3"]
+    assert metrics["coalesced"] == 1
+
+
+def test_idle_chats_are_pruned():
+    bot = FakeBot()
+
+    async def scenario(queue):
+        await asyncio.gather(*(queue.send(c, text="x") for c in range(50)))
+        await asyncio.sleep(0.1)
+        return len(queue._chats), len(queue._ready_at)
+
+    assert run(scenario, bot, global_rate=1000, per_chat_interval=0.05) == (0, 0)
+
+
+def test_latency_excludes_requested_delay():
+    bot = FakeBot()
+
+    async def scenario(queue):
+        await queue.send(1, delay=0.3, text="proses")
+        return queue.metrics()
+
+    metrics = run(scenario, bot)
+    assert metrics["latency_max"] < 0.1
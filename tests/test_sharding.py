@@ -0,0 +1,117 @@
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+from telegram import Update
+
+from mailv2 import ShardPool, shard_for
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def echo_worker(results, shard, num_workers, inbox):
+    while True:
+        data = inbox.get()
+        if data is None:
+            results.put(("stop", shard))
+            return
+        results.put((shard, data["message"]["chat"]["id"]))
+
+
+def make_update(update_id, chat_id):
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "text": "/start",
+        },
+    }, None)
+
+
+def make_pool(num_workers):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    pool = ShardPool(num_workers, echo_worker, (results,), ctx=ctx)
+    pool.start()
+    return pool, results
+
+
+def route(pool, updates):
+    async def run():
+        for update in updates:
+            await pool.route_update(update, None)
+    asyncio.run(run())
+
+
+def test_shard_for_single_worker_or_no_chat():
+    assert shard_for(None, 4) == 0
+    assert shard_for(123456789, 1) == 0
+
+
+def test_shard_for_stable_across_processes():
+    chat_ids = [1, 42, 123456789, -1001234567890]
+    expected = [shard_for(c, 4) for c in chat_ids]
+    code = f"from mailv2 import shard_for; print([shard_for(c, 4) for c in {chat_ids!r}])"
+    for seed in ("0", "1", "12345"):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=ROOT, env=dict(os.environ, PYTHONHASHSEED=seed),
+            capture_output=True, text=True, check=True,
+        )
+        assert out.stdout.strip().splitlines()[-1] == str(expected)
+
+
+def test_shard_for_spreads_chats_evenly():
+    num_workers = 4
+    chat_ids = list(range(100_000, 110_000)) + list(range(-1001000010000, -1001000000000))
+    counts = Counter(shard_for(c, num_workers) for c in chat_ids)
+    mean = len(chat_ids) / num_workers
+    assert set(counts) == set(range(num_workers))
+    for count in counts.values():
+        assert abs(count - mean) / mean < 0.05
+
+
+def test_route_update_keeps_chat_on_one_worker():
+    pool, results = make_pool(3)
+    try:
+        chat_ids = [11, 22, 33, 44, 55, -1001234567890]
+        route(pool, [make_update(i, c) for i, c in enumerate(chat_ids * 3)])
+        seen = [results.get(timeout=30) for _ in range(len(chat_ids) * 3)]
+    finally:
+        pool.stop()
+    for shard, chat_id in seen:
+        assert shard == shard_for(chat_id, 3)
+
+
+def test_dead_worker_is_restarted():
+    pool, results = make_pool(2)
+    try:
+        chat_id = next(c for c in range(1, 1000) if shard_for(c, 2) == 1)
+        dead = pool.workers[1]
+        dead.terminate()
+        dead.join(timeout=10)
+        route(pool, [make_update(1, chat_id)])
+        assert results.get(timeout=30) == (1, chat_id)
+        assert pool.workers[1] is not dead and pool.workers[1].is_alive()
+    finally:
+        pool.stop()
+
+
+def test_stop_drains_workers_with_sentinel():
+    pool, results = make_pool(3)
+    chat_ids = [100 + i for i in range(9)]
+    route(pool, [make_update(i, c) for i, c in enumerate(chat_ids)])
+    pool.stop()
+    items = [results.get(timeout=30) for _ in range(len(chat_ids) + 3)]
+    assert not any(worker.is_alive() for worker in pool.workers)
+    for shard in range(3):
+        # sentinel None datang terakhir: semua update shard ini diproses sebelum worker berhenti
+        own = [item for item in items if item[0] == shard or item == ("stop", shard)]
+        assert own[-1] == ("stop", shard)
+        assert len(own) - 1 == sum(shard_for(c, 3) == shard for c in chat_ids)